@@ -252,7 +252,7 @@ class TEvent:
         self._todo.update(self._links)
         if self._todo and not self._notifier:
             self._notifier = True
-            self.hub.schedule_call_now(self._notify_links)
+            self.hub.schedule_call_now_0(self._notify_links)
 
     def clear(self):
         """Reset the internal flag to false.
@@ -305,7 +305,7 @@ class TEvent:
         if self._flag and not self._notifier:
             self._todo.add(callback)
             self._notifier = True
-            self.hub.schedule_call_now(self._notify_links)
+            self.hub.schedule_call_now_0(self._notify_links)
 
     def unlink(self, callback):
         """Remove the callback set by :meth:`rawlink`"""
@@ -6,7 +6,7 @@ import errno
 from errno import EWOULDBLOCK, EBADF
 
 from . import patcher
-from .hubs import trampoline
+from .hubs import trampoline, notify_close
 from .exceptions import IOClosed, SOCKET_BLOCKING, SOCKET_CLOSED, CONNECT_ERR, CONNECT_SUCCESS
 from .const import READ, WRITE
 
@@ -82,8 +82,12 @@ class socket(_socket.socket):
             self._trampoline(self.fileno(), READ, timeout=self.gettimeout(),
                              timeout_exc=s_timeout('timed out'))
 
-    def _real_close(self, _ss=_socket.socket):
+    def _real_close(self, _ss=_socket.socket, _notify_close=notify_close):
         # This function should not reference any globals. See Python issue #808164.
+        fd = self.fileno()
+        if fd >= 0:
+            # let the hub release its state for this fd before the OS can recycle it
+            _notify_close(fd)
         # noinspection PyArgumentList
         _ss.close(self)
 
@@ -237,6 +237,6 @@ def kill(g, *throw_args):
     current = greenlet.getcurrent()
     if current is not hub:
         # arrange to wake the caller back up immediately
-        hub.schedule_call_now(current.switch)
+        hub.schedule_call_now_0(current.switch)
 
     g.throw(*throw_args)
@@ -1,4 +1,4 @@
 from .switch import trampoline
-from .hub import get_default_hub, use_hub, get_hub, notify_opened
+from .hub import get_default_hub, use_hub, get_hub, notify_opened, notify_close
 
 __all__ = ['use_hub', 'get_hub', 'get_default_hub', 'trampoline']
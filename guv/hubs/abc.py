@@ -72,6 +72,17 @@ class AbstractHub(greenlet.greenlet, metaclass=ABCMeta):
         """
         pass
 
+    def schedule_call_now_0(self, cb):
+        """Schedule a callable taking no arguments to be called on the next event loop iteration
+
+        This is the same as calling :meth:`schedule_call_now` with no arguments for `cb`, but hubs
+        may implement it without any argument packing. This is the common case, e.g. switching
+        back to a greenlet.
+
+        :param Callable cb: callback to call
+        """
+        self.schedule_call_now(cb)
+
     @abstractmethod
     def schedule_call_global(self, seconds, cb, *args, **kwargs):
         """Schedule a callable to be called after 'seconds' seconds have elapsed. The timer will NOT
@@ -143,6 +154,16 @@ class AbstractHub(greenlet.greenlet, metaclass=ABCMeta):
 
         return found
 
+    def notify_close(self, fd):
+        """Mark the specified file descriptor as about to be closed
+
+        Hubs which keep per-fd state beyond the lifetime of a listener release it here, before the
+        descriptor can be recycled by the OS. The default implementation does nothing.
+
+        :param int fd: file descriptor
+        """
+        pass
+
     def _add_listener(self, listener):
         """Add listener to internal dictionary
 
@@ -169,12 +190,21 @@ class AbstractHub(greenlet.greenlet, metaclass=ABCMeta):
         del self.listeners[listener.evtype][listener.fd]
 
     def _squelch_exception(self, exc_info):
-        if self._debug_exceptions and not issubclass(exc_info[0], NOT_ERROR):
-            traceback.print_exception(*exc_info)
+        self._squelch_exception_obj(exc_info[1])
+
+    def _squelch_exception_obj(self, exc):
+        """Report an exception raised by a callback without building an exc_info tuple
+
+        The traceback is taken from `exc.__traceback__`.
+
+        :type exc: BaseException
+        """
+        if self._debug_exceptions and not isinstance(exc, NOT_ERROR):
+            traceback.print_exception(type(exc), exc, exc.__traceback__)
             sys.stderr.flush()
 
-        if issubclass(exc_info[0], SYSTEM_ERROR):
-            self._handle_system_error(exc_info)
+        if isinstance(exc, SYSTEM_ERROR):
+            self._handle_system_error((type(exc), exc, exc.__traceback__))
 
     def _handle_system_error(self, exc_info):
         current = greenlet.getcurrent()
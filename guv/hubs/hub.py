@@ -28,6 +28,19 @@ def notify_opened(fd):
     hub.notify_opened(fd)
 
 
+def notify_close(fd):
+    """Mark the specified file descriptor as about to be closed
+
+    This lets the hub release any state it keeps for the file descriptor, such as cached poll
+    handles. Nothing is done if no hub has been created in the current thread.
+
+    :param int fd: file descriptor
+    """
+    hub = getattr(_threadlocal, 'hub', None)
+    if hub is not None:
+        hub.notify_close(fd)
+
+
 def get_default_hub():
     """Get default hub implementation
     """
@@ -36,7 +49,7 @@ def get_default_hub():
     for name in names:
         try:
             module = importlib.import_module('guv.hubs.{}'.format(name))
-            log.debug('Hub: use {}'.format(name))
+            log.debug('Hub: use %s', name)
             return module
         except ImportError:
             # try the next possible hub
@@ -8,48 +8,87 @@ Notes:
 - The loop is free to exit (:meth:`Loop.run` is free to return) when there are no non-internal
   handles/callbacks remaining - that is, when there are no more Poll/Timer handles and no more
   callbacks scheduled.
-- The loop has four internal handles at all times: Signal (to watch for SIGINT), Prepare (to run
-  scheduled callbacks), Idle (to ensure a zero-timeout poll when callbacks are scheduled),  and
-  Check (to unref the Prepare handle if there are no remaining scheduled callbacks). The Signal and
-  Check handles are unreferenced since they are static and will not keep the loop alive. The Idle
-  handle is *only* active if callbacks are scheduled and will not keep the loop alive. The Prepare
-  handle is therefore the only remaining handle which has any control over whether or not the loop
-  exits when no other handles are active. Therefore, the Prepare handle must only be unreferenced
-  when there are no callbacks scheduled and *must* be referenced at all other times.
+- The loop has up to two internal handles: Signal (to watch for SIGINT) and Prepare (to run
+  scheduled callbacks). Both are created lazily: the Signal handle when the loop first runs, and
+  the Prepare handle when the first callback is scheduled, so that short-lived hubs and loops which
+  only do I/O never create them. The Signal handle is unreferenced since it is static and will not
+  keep the loop alive. The Prepare handle is only active while callbacks are scheduled: it is
+  started when the first callback is scheduled and stopped once there are none left, so it keeps
+  the loop alive exactly as long as there are callbacks to fire and costs nothing otherwise.
+- :meth:`Hub.run` drives the loop one iteration at a time: it uses UV_RUN_NOWAIT when callbacks
+  are scheduled (so the loop never blocks in poll while there is immediate work to do) and
+  UV_RUN_ONCE otherwise, based on the `Hub._pending` flag.
 """
 import signal
 import logging
 import greenlet
 import sys
+from collections import deque
+from functools import partial
 
 from guv.hubs.abc import AbstractListener
 import pyuv_cffi
 from . import abc
+from ..const import READ, WRITE
 
 log = logging.getLogger('guv')
 
 
+def _run_callbacks(callbacks, squelch):
+    """Call and remove every entry in `callbacks`
+
+    The exception handler is set up once for the whole batch rather than once per callback; after
+    an exception has been squelched, the remaining callbacks are run in the same way.
+
+    :param deque callbacks: zero-argument callables or (cb, args, kwargs) tuples
+    :param squelch: called with the exception object if a callback raises
+    :type squelch: Callable(exc: BaseException)
+    """
+    popleft = callbacks.popleft
+    while callbacks:
+        try:
+            while callbacks:
+                entry = popleft()
+                if entry.__class__ is tuple:
+                    cb, args, kwargs = entry
+                    cb(*args, **kwargs)
+                else:
+                    entry()
+        except BaseException as e:
+            squelch(e)
+
+
 class UvFdListener(AbstractListener):
-    def __init__(self, evtype, fd, handle):
+    def __init__(self, evtype, fd, handle, cb=None, cb_args=()):
         """
         :param handle: pyuv_cffi Handle object
         :type handle: pyuv_cffi.Handle
+        :param cb: callback to call when the file descriptor is ready
+        :param tuple cb_args: callback positional arguments
         """
         super().__init__(evtype, fd)
         self.handle = handle
+        self.cb = cb
+        self.cb_args = cb_args
 
 
 class Timer(abc.AbstractTimer):
-    def __init__(self, timer_handle):
+    def __init__(self, hub, timer_handle, cb, args, kwargs):
         """
+        :type hub: Hub
         :type timer_handle: pyuv.Timer
         """
+        self.hub = hub
         self.timer_handle = timer_handle
+        self.tpl = cb, args, kwargs
 
     def cancel(self):
-        if not self.timer_handle.closed:
-            self.timer_handle.stop()
-            self.timer_handle.close()
+        # the handle is detached once the timer has fired or been cancelled, since it may since
+        # have been reused for another timer
+        timer_handle = self.timer_handle
+        if timer_handle is not None:
+            self.timer_handle = None
+            self.hub._release_timer_handle(timer_handle)
 
 
 class Hub(abc.AbstractHub):
@@ -58,38 +97,47 @@ class Hub(abc.AbstractHub):
         self.Listener = UvFdListener
         self.stopping = False
         self.running = False
-        self.callbacks = []
 
-        #: :type: pyuv.Loop
-        self.loop = pyuv_cffi.Loop.default_loop()
+        # immediate callbacks are double-buffered: `_fire_callbacks` drains the back buffer while
+        # callbacks scheduled in the meantime land in the front buffer (aliased as `callbacks`);
+        # entries are zero-argument callables, or (cb, args, kwargs) tuples if kwargs were given
+        # a deque is already a ring of fixed-size blocks which are freed as they are drained, so
+        # memory use follows the current backlog rather than the largest burst ever seen
+        self._cb_front = deque()
+        self._cb_back = deque()
+        self.callbacks = self._cb_front
 
-        # create a signal handle to listen for SIGINT
-        self.sig_h = pyuv_cffi.Signal(self.loop)
-        self.sig_h.start(self.signal_received, signal.SIGINT)
-        self.sig_h.ref = False  # don't keep loop alive just for this handle
+        # True if immediate callbacks are scheduled; checked before every loop iteration
+        self._pending = False
 
-        # create a uv_idle handle to allow non-I/O callbacks to get called quickly
-        self.idle_h = pyuv_cffi.Idle(self.loop)
+        # stopped Timer handles kept for reuse by `schedule_call_global()`
+        self._timer_pool = deque()
+        self._timer_pool_size = 1024
 
-        # create a prepare handle to fire immediate callbacks every loop iteration
-        self.prepare_h = pyuv_cffi.Prepare(self.loop)
-        self.prepare_h.start(self._fire_callbacks)
+        # Poll handles kept for reuse by `add()`, keyed by (evtype, fd); they are stopped, not
+        # closed, when their listener is removed
+        self._poll_cache = {}
 
-        # create a check handle to unref the prepare handle and allow the loop to exit if necessary
-        self.check_h = pyuv_cffi.Check(self.loop)
-        self.check_h.start(self._check_cb)
-        self.check_h.ref = False
+        # handle callbacks are bound once and shared by all handles; per-handle state is found
+        # through the handle's `data` attribute
+        self._timer_cb = self._on_timer
+        self._poll_cb = self._on_poll
+        self._prepare_cb = self._fire_callbacks
 
-    def _idle_cb(self, idle_h):
-        idle_h.stop()
+        #: :type: pyuv.Loop
+        self.loop = pyuv_cffi.Loop.default_loop()
 
-    def _check_cb(self, check_h):
-        """
-        The Prepare handle's only purpose is to run scheduled callbacks. If there are no
-        remaining scheduled callbacks, then it must be unreferenced so it does not keep the loop
-        alive after all handles and callbacks have been completed.
-        """
-        self.prepare_h.ref = bool(self.callbacks)
+        # signal handle to listen for SIGINT, created by `run()`
+        self.sig_h = None
+
+        # prepare handle to fire immediate callbacks, created by the first call to
+        # `schedule_call_now()` and only active while callbacks are scheduled
+        self.prepare_h = None
+
+    def _start_signal_handle(self):
+        self.sig_h = pyuv_cffi.Signal(self.loop)
+        self.sig_h.start(self.signal_received, signal.SIGINT)
+        self.sig_h.ref = False  # don't keep loop alive just for this handle
 
     def run(self):
         assert self is greenlet.getcurrent()
@@ -104,11 +152,30 @@ class Hub(abc.AbstractHub):
         try:
             self.running = True
             self.stopping = False
-            self.loop.run(pyuv_cffi.UV_RUN_DEFAULT)
+
+            if self.sig_h is None:
+                self._start_signal_handle()
+
+            loop = self.loop
+            while not self.stopping:
+                if self._pending:
+                    alive = loop.run(pyuv_cffi.UV_RUN_NOWAIT)
+                else:
+                    alive = loop.run(pyuv_cffi.UV_RUN_ONCE)
+
+                if not alive and not self._pending:
+                    break
         finally:
             self.running = False
             self.stopping = False
 
+            while self._timer_pool:
+                self._timer_pool.pop().close()
+
+            for poll_h in self._poll_cache.values():
+                poll_h.close()
+            self._poll_cache.clear()
+
     def abort(self):
         print()
         log.debug('Abort loop')
@@ -123,78 +190,135 @@ class Hub(abc.AbstractHub):
         This is called by `self.prepare_h` and calls callbacks scheduled by methods such as
         :meth:`schedule_call_now()` or `gyield()`.
         """
-        callbacks = self.callbacks
-        self.callbacks = []
-        for cb, args, kwargs in callbacks:
-            try:
-                cb(*args, **kwargs)
-            except:
-                self._squelch_exception(sys.exc_info())
+        # swap buffers so that callbacks scheduled by the callbacks below run on the next iteration
+        self._cb_front, self._cb_back = self._cb_back, self._cb_front
+        self.callbacks = self._cb_front
+        self._pending = bool(self.callbacks)
+
+        _run_callbacks(self._cb_back, self._squelch_exception_obj)
 
         # Check if more callbacks have been scheduled by the callbacks that were just executed.
         # Since these may be non-I/O callbacks (such as calls to `gyield()` or
-        # `schedule_call_now()`, start a uv_idle_t handle so that libuv can do a zero-timeout poll
-        # and quickly start another loop iteration.
-        if self.callbacks:
-            self.idle_h.start(self._idle_cb)
-
-        # If no callbacks are scheduled, unref the prepare_h to allow the loop to automatically
-        # exit safely.
-        prepare_h.ref = bool(self.callbacks)
+        # `schedule_call_now()`), stop the current iteration so that libuv does a zero-timeout
+        # poll and :meth:`run` can start the next iteration with UV_RUN_NOWAIT.
+        if self._pending:
+            self.loop.stop()
+        else:
+            # nothing left to do; don't fire (or keep the loop alive) until the next callback is
+            # scheduled
+            prepare_h.stop()
+
+    def _start_prepare_handle(self):
+        """Start the prepare handle when the first callback since it was last stopped is scheduled
+
+        Restarting it from within :meth:`_fire_callbacks` is a no-op.
+        """
+        if self.prepare_h is None:
+            self.prepare_h = pyuv_cffi.Prepare(self.loop)
+        self.prepare_h.start(self._prepare_cb)
 
     def schedule_call_now(self, cb, *args, **kwargs):
-        self.callbacks.append((cb, args, kwargs))
+        if not self._pending:
+            self._start_prepare_handle()
+
+        if kwargs:
+            self.callbacks.append((cb, args, kwargs))
+        elif args:
+            self.callbacks.append(partial(cb, *args))
+        else:
+            self.callbacks.append(cb)
+        self._pending = True
+
+    def schedule_call_now_0(self, cb):
+        if not self._pending:
+            self._start_prepare_handle()
+
+        self.callbacks.append(cb)
+        self._pending = True
 
     def schedule_call_global(self, seconds, cb, *args, **kwargs):
-        def timer_callback(timer_h):
-            try:
-                cb(*args, **kwargs)
-            except:
-                self._squelch_exception(sys.exc_info())
+        if self._timer_pool:
+            timer_handle = self._timer_pool.pop()
+        else:
+            timer_handle = pyuv_cffi.Timer(self.loop)
 
-            # required for cleanup
-            if not timer_h.closed:
-                timer_h.stop()
-                timer_h.close()
+        timer = Timer(self, timer_handle, cb, args, kwargs)
+        timer_handle.data = timer
+        timer_handle.start(self._timer_cb, seconds, 0)
 
-        timer_handle = pyuv_cffi.Timer(self.loop)
-        timer_handle.start(timer_callback, seconds, 0)
+        return timer
 
-        return Timer(timer_handle)
+    def _on_timer(self, timer_h):
+        """Timer callback shared by all timers scheduled by :meth:`schedule_call_global`
 
-    def add(self, evtype, fd, cb, tb, cb_args=()):
-        poll_h = pyuv_cffi.Poll(self.loop, fd)
-        listener = UvFdListener(evtype, fd, poll_h)
+        :type timer_h: pyuv.Timer
+        """
+        timer = timer_h.data
+
+        # detach the handle first so that `timer.cancel()` called by `cb` is a no-op
+        timer.timer_handle = None
+        cb, args, kwargs = timer.tpl
+        del timer.tpl
+        try:
+            cb(*args, **kwargs)
+        except BaseException as e:
+            self._squelch_exception_obj(e)
 
-        def poll_cb(poll_h, events, errno):
-            """Read callback for pyuv
+        # the handle must not be reused until its callback has returned
+        self._release_timer_handle(timer_h)
 
-            pyuv requires a callback with this signature
+    def _release_timer_handle(self, timer_h):
+        """Stop a Timer handle and keep it for reuse, or close it if enough are already pooled
 
-            :type poll_h: pyuv.Poll
-            :type events: int
-            :type errno: int
-            """
-            try:
-                cb(*cb_args)
-            except:
-                self._squelch_exception(sys.exc_info())
+        :type timer_h: pyuv.Timer
+        """
+        timer_h.stop()
+        timer_h.data = None
+        if len(self._timer_pool) < self._timer_pool_size:
+            self._timer_pool.append(timer_h)
+        else:
+            timer_h.close()
 
-                try:
-                    self.remove(listener)
-                except Exception as e:
-                    sys.stderr.write('Exception while removing listener: {}\n'.format(e))
-                    sys.stderr.flush()
+    def add(self, evtype, fd, cb, tb, cb_args=()):
+        poll_h = self._poll_cache.get((evtype, fd))
+        if poll_h is None:
+            poll_h = self._poll_cache[evtype, fd] = pyuv_cffi.Poll(self.loop, fd)
+        listener = UvFdListener(evtype, fd, poll_h, cb, cb_args)
 
         self._add_listener(listener)
 
         # start the pyuv Poll object
         # note that UV_READABLE and UV_WRITABLE correspond to const.READ and const.WRITE
-        poll_h.start(evtype, poll_cb)
+        poll_h.data = listener
+        poll_h.start(evtype, self._poll_cb)
 
         # self.debug()
         return listener
 
+    def _on_poll(self, poll_h, status, events):
+        """Poll callback shared by all listeners added by :meth:`add`
+
+        pyuv requires a callback with this signature
+
+        :type poll_h: pyuv.Poll
+        :type status: int
+        :type events: int
+        """
+        listener = poll_h.data
+        if listener is None:
+            return
+
+        try:
+            listener.cb(*listener.cb_args)
+        except BaseException as e:
+            self._squelch_exception_obj(e)
+
+            try:
+                self.remove(listener)
+            except Exception as e2:
+                sys.stderr.write('Exception while removing listener: {}\n'.format(e2))
+                sys.stderr.flush()
+
     def remove(self, listener):
         """Remove listener
 
@@ -204,13 +328,40 @@ class Hub(abc.AbstractHub):
         super()._remove_listener(listener)
         # log.debug('call w.handle.stop(), fd: {}'.format(listener.handle.fileno()))
 
-        # initiate correct cleanup sequence (these three statements are critical)
-        listener.handle.ref = False
-        listener.handle.stop()
-        listener.handle.close()
+        # a stopped handle does not keep the loop alive; keep it cached for the next `add()` on
+        # this fd, it is only closed once the fd is closed or recycled (see `notify_close()` and
+        # `notify_opened()`), or here if it was evicted from the cache while still in use
+        poll_h = listener.handle
+        poll_h.stop()
+        poll_h.data = None
         listener.handle = None
+        if self._poll_cache.get((listener.evtype, listener.fd)) is not poll_h:
+            poll_h.close()
         # self.debug()
 
+    def notify_opened(self, fd):
+        found = super().notify_opened(fd)
+
+        # cached Poll handles belong to the file that previously had this descriptor
+        self._evict_poll_handles(fd)
+
+        return found
+
+    def notify_close(self, fd):
+        self._evict_poll_handles(fd)
+
+    def _evict_poll_handles(self, fd):
+        """Remove the cached Poll handles for `fd` and close them
+
+        A handle still used by a listener is closed by :meth:`remove` instead.
+
+        :param int fd: file descriptor
+        """
+        for evtype in (READ, WRITE):
+            poll_h = self._poll_cache.pop((evtype, fd), None)
+            if poll_h is not None and poll_h.data is None:
+                poll_h.close()
+
     def signal_received(self, sig_handle, signo):
         """Signal handler for pyuv.Signal
 
@@ -25,7 +25,7 @@ def gyield(switch_back=True):
     current = greenlet.getcurrent()
     hub = get_hub()
     if switch_back:
-        hub.schedule_call_now(current.switch)
+        hub.schedule_call_now_0(current.switch)
     hub.switch()
 
 
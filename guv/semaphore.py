@@ -131,7 +131,7 @@ class Semaphore:
         """
         self.counter += 1
         if self._waiters:
-            hubs.get_hub().schedule_call_now(self._do_acquire)
+            hubs.get_hub().schedule_call_now_0(self._do_acquire)
         return True
 
     def _do_acquire(self):
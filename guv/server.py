@@ -1,34 +1,253 @@
+import os
+import signal
+import stat
 import sys
 import logging
+import traceback
+import weakref
 from abc import ABCMeta, abstractmethod
+from collections import deque
 
-from . import greenpool, patcher, greenthread
-from .green import socket, ssl
-from .hubs import get_hub
+import greenlet
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
 
-original_socket = patcher.original('socket')
+from . import greenpool, patcher
+from .const import READ
+from .green import socket, ssl
+from .hubs import get_hub, trampoline
+from .hubs.hub import _threadlocal as _hub_threadlocal
 
 log = logging.getLogger('guv')
 
+_threading = patcher.original('threading')
+
+#: factory for the fresh context each client handler runs in when bare greenlets are recycled, or
+#: None if contextvars or greenlet context switching is not available
+_new_context = (contextvars.Context
+                if contextvars is not None and hasattr(greenlet.greenlet, 'gr_context') else None)
+
+#: options each socket created by :func:`listen` was created with, so that :func:`serve` can create
+#: identical sockets in worker processes
+_listen_options = weakref.WeakKeyDictionary()
+
+
+def serve(sock, handle, concurrency=1000, workers=1):
+    """Serve connections accepted on `sock`, handling each one in a pooled greenlet
+
+    If `workers` is greater than 1, ``workers - 1`` child processes are forked. Each child listens
+    on a socket of its own bound to the same address with SO_REUSEPORT, so that the kernel balances
+    incoming connections between the processes instead of all of them contending for a single
+    accept queue. `sock` must therefore have been created with ``listen(addr, reuse_port=True)``;
+    the children's sockets are created with the same options. Since the event loop cannot be
+    shared across processes, this must be called before the hub is used in the current process,
+    and since the parent installs a SIGCHLD handler, it must be called from the main thread; a
+    RuntimeError is raised otherwise.
+
+    The parent reaps children that exit on SIGCHLD. When the parent's server stops (or a fork
+    fails), the remaining children are terminated with SIGTERM and reaped before returning.
+
+    To keep each worker's connections on the CPU that receives their packets, pin the processes to
+    CPUs, e.g. by calling ``os.sched_setaffinity(0, {cpu})`` in each worker (see
+    :func:`os.sched_setaffinity`) or by starting the server under ``taskset``.
+
+    :param sock: listening server socket
+    :param handle: client handler: Callable(sock: socket, addr: tuple[str, int]) -> None
+    :param int concurrency: maximum number of connections handled concurrently per process
+    :param int workers: number of processes accepting connections
+    """
+    if workers <= 1:
+        pool = greenpool.GreenPool(concurrency)
+        server = Server(sock, handle, pool, 'spawn_n')
+        server.start()
+        return
+
+    listen_kwargs = _listen_options.get(sock)
+    if listen_kwargs is None:
+        raise ValueError('serve() with workers > 1 requires a socket created by listen()')
+
+    if (not hasattr(socket, 'SO_REUSEPORT')
+            or not sock.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT)):
+        raise ValueError('serve() with workers > 1 requires a socket with SO_REUSEPORT set')
+
+    if _threading.current_thread() is not _threading.main_thread():
+        raise RuntimeError('serve() with workers > 1 must be called from the main thread')
+
+    if hasattr(_hub_threadlocal, 'hub'):
+        # forked children would share the parent's event loop, including its signal handling
+        raise RuntimeError('serve() with workers > 1 must be called before the hub is used')
+
+    pids = set()
+    prev_sigchld = signal.signal(signal.SIGCHLD, lambda signo, frame: _reap_workers(pids))
+    try:
+        for _ in range(workers - 1):
+            pid = os.fork()
+            if pid == 0:
+                _serve_worker(sock, handle, concurrency, listen_kwargs)
+            pids.add(pid)
+
+        serve(sock, handle, concurrency)
+    finally:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL if prev_sigchld is None else prev_sigchld)
+        _stop_workers(pids)
+
+
+def _serve_worker(sock, handle, concurrency, listen_kwargs):
+    """Serve connections in a forked worker process, then exit the process
+
+    :param sock: the parent's listening socket, which is replaced by a new SO_REUSEPORT socket
+    :param dict listen_kwargs: keyword arguments `sock` was created with by :func:`listen`
+    """
+    status = 0
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        worker_sock = listen(sock.getsockname(), sock.family, **listen_kwargs)
+        sock.close()
+        serve(worker_sock, handle, concurrency)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def _reap_workers(pids):
+    """Reap worker processes which have exited, without blocking
+
+    :param set pids: pids of running worker processes; reaped pids are removed
+    """
+    for pid in list(pids):
+        try:
+            reaped, status = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            reaped, status = pid, None
+
+        if reaped:
+            pids.discard(pid)
+            log.warning('serve: worker process %d exited with status %s', pid, status)
 
-def serve(sock, handle, concurrency=1000):
-    pool = greenpool.GreenPool(concurrency)
-    server = Server(sock, handle, pool, 'spawn_n')
-    server.start()
 
+def _stop_workers(pids):
+    """Terminate worker processes and wait for them to exit
+
+    :param set pids: pids of running worker processes; emptied on return
+    """
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    for pid in pids:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+    pids.clear()
+
+
+def listen(addr, family=socket.AF_INET, backlog=511, reuse_port=False, rcvbuf=None, sndbuf=None,
+           nodelay=False):
+    """Convenience function for opening server sockets
+
+    Socket options set on the listening socket are inherited by accepted client sockets.
+
+    If `addr` is a string (or `family` is AF_UNIX), a Unix domain socket is created instead of a
+    TCP socket; this skips the TCP/IP stack entirely for local IPC. A stale socket file left over at
+    that path is removed first.
+
+    :param addr: Address to listen on. For TCP sockets, this is a (host, port) tuple; for Unix
+        domain sockets, it is a file system path.
+    :param family: Socket family, optional.  See :mod:`socket` documentation for available families.
+    :param int backlog: maximum number of queued connections
+    :param bool reuse_port: set SO_REUSEPORT (where supported) so that multiple processes can listen
+        on the same address and the kernel balances connections between them
+    :param rcvbuf: SO_RCVBUF size in bytes, or 'max' for the platform maximum, optional
+    :type rcvbuf: int or str or None
+    :param sndbuf: SO_SNDBUF size in bytes, or 'max' for the platform maximum, optional
+    :type sndbuf: int or str or None
+    :param bool nodelay: set TCP_NODELAY (disable Nagle's algorithm)
+    :return: The listening green socket object.
+    """
+    options = {'backlog': backlog, 'reuse_port': reuse_port, 'rcvbuf': rcvbuf, 'sndbuf': sndbuf,
+               'nodelay': nodelay}
+
+    if isinstance(addr, (str, bytes)):
+        family = socket.AF_UNIX
+
+    is_unix = family == getattr(socket, 'AF_UNIX', None)
 
-def listen(addr, family=socket.AF_INET, backlog=511):
     server_sock = socket.socket(family, socket.SOCK_STREAM)
 
-    if sys.platform[:3] != 'win':
-        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if is_unix:
+        _remove_stale_unix_socket(addr)
+    else:
+        if sys.platform[:3] != 'win':
+            server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        if reuse_port and hasattr(socket, 'SO_REUSEPORT'):
+            server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+    # buffer sizes must be set before listen() for the TCP window scale to take them into account
+    if rcvbuf == 'max':
+        rcvbuf = _max_sock_buf('rmem_max')
+    if rcvbuf is not None:
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+
+    if sndbuf == 'max':
+        sndbuf = _max_sock_buf('wmem_max')
+    if sndbuf is not None:
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+
+    if nodelay and family in {socket.AF_INET, socket.AF_INET6}:
+        server_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
     server_sock.bind(addr)
     server_sock.listen(backlog)
+    _listen_options[server_sock] = options
 
     return server_sock
 
 
+def _remove_stale_unix_socket(path):
+    """Remove a Unix domain socket file left over at `path`, so that it can be bound again
+
+    Only socket files are removed; anything else at `path` is left for bind() to fail on. Paths
+    starting with a null byte are in the Linux abstract namespace and have no file to remove.
+
+    :param path: file system path
+    :type path: str or bytes
+    """
+    if path[:1] in ('\0', b'\0'):
+        return
+
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _max_sock_buf(name):
+    """Get the maximum socket buffer size allowed by the kernel
+
+    :param str name: 'rmem_max' or 'wmem_max'
+    :return: buffer size in bytes, or None if it cannot be determined on this platform
+    :rtype: int or None
+    """
+    try:
+        with open('/proc/sys/net/core/{}'.format(name)) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
 def connect(addr, family=socket.AF_INET, bind=None):
     """Convenience function for opening client sockets.
 
@@ -64,11 +283,16 @@ class StopServe(Exception):
 
 
 class AbstractServer(metaclass=ABCMeta):
+    #: maximum number of idle greenlets kept for reuse when bare greenlets are used
+    greenlet_pool_size = 1000
+
     def __init__(self, server_sock, client_handler_cb, pool=None, spawn=None):
         """
         If pool and spawn are None (default), bare greenlets will be used and the spawn mechanism
         will be greenlet.switch(). This is the simplest and most direct way to spawn greenlets to
-        handle client requests, however it is not the most stable.
+        handle client requests, however it is not the most stable. Bare greenlets are recycled:
+        once a client handler returns, its greenlet waits to handle the next client. Where
+        supported, each client handler runs in a fresh :mod:`contextvars` context.
 
         If more control is desired over client handlers, specify a greenlet pool class such as
         `GreenPool`, and specify a spawn mechanism. If specifying a pool class, the the name of the
@@ -88,16 +312,22 @@ class AbstractServer(metaclass=ABCMeta):
         if pool is None:
             # use bare greenlets
             self.pool = None
+            self._greenlet_pool = deque()
             log.debug('Server: use fast spawn_n')
         else:
             # create a pool instance
             self.pool = pool
             self.spawn = getattr(self.pool, spawn)
-            log.debug('Server: use {}.{}'.format(pool, spawn))
+            log.debug('Server: use %s.%s', pool, spawn)
 
         self.hub = get_hub()
 
-        self.address = server_sock.getsockname()[:2]
+        address = server_sock.getsockname()
+        if isinstance(address, tuple):
+            # (host, port); IPv6 addresses also include flowinfo and scope_id
+            address = address[:2]
+        #: (host, port) tuple, or path for Unix domain sockets
+        self.address = address
 
     @abstractmethod
     def start(self):
@@ -111,7 +341,7 @@ class AbstractServer(metaclass=ABCMeta):
         """
 
     def handle_error(self, msg, level=logging.ERROR, exc_info=True):
-        log.log(level, '{0}: {1} --> closing'.format(self, msg), exc_info=exc_info)
+        log.log(level, '%s: %s --> closing', self, msg, exc_info=exc_info)
         self.stop()
 
     def _spawn(self, client_sock, addr):
@@ -123,24 +353,145 @@ class AbstractServer(metaclass=ABCMeta):
         :type addr: tuple[str, int]
         """
         if self.pool is None:
-            greenthread.spawn_n(self.client_handler_cb, client_sock, addr)
+            greenlet_pool = self._greenlet_pool
+            while greenlet_pool:
+                g = greenlet_pool.pop()
+                if not g.dead:
+                    break
+            else:
+                g = greenlet.greenlet(self._worker, parent=self.hub)
+            self.hub.schedule_call_now(g.switch, client_sock, addr)
         else:
             self.spawn(self.client_handler_cb, client_sock, addr)
 
+    def _worker(self, client_sock, addr):
+        """Run client handlers in a recycled bare greenlet
+
+        After each client handler returns, the current greenlet is returned to the greenlet pool
+        and switches to the hub until :meth:`_spawn` switches back to it with the next client. If
+        the pool is full, the greenlet exits instead. If the greenlet is woken by anything other
+        than :meth:`_spawn` (e.g. a timer left behind by the client handler) or an exception is
+        thrown into it while waiting, it is removed from the pool and exits.
+
+        :param client_sock: client socket
+        :type client_sock: socket.socket
+        :param addr: address tuple
+        :type addr: tuple[str, int]
+        """
+        current = greenlet.getcurrent()
+        while True:
+            if _new_context is not None:
+                # don't leak context variables set by the previous client's handler
+                current.gr_context = _new_context()
+
+            try:
+                self.client_handler_cb(client_sock, addr)
+            except Exception as e:
+                # keep the greenlet alive for the next client; GreenletExit and system errors are
+                # propagated to the hub as with an unrecycled greenlet
+                self.hub._squelch_exception_obj(e)
+
+            # don't keep the previous client alive while waiting
+            client_sock = addr = None
+
+            if len(self._greenlet_pool) >= self.greenlet_pool_size:
+                return
+
+            self._greenlet_pool.append(current)
+            try:
+                args = self.hub.switch()
+            except BaseException:
+                self._discard_greenlet(current)
+                raise
+
+            if type(args) is not tuple or len(args) != 2:
+                log.debug('%s: worker woken with unexpected value %r, exiting', self, args)
+                self._discard_greenlet(current)
+                return
+
+            client_sock, addr = args
+
+    def _discard_greenlet(self, g):
+        """Remove `g` from the greenlet pool if it is still there
+        """
+        try:
+            self._greenlet_pool.remove(g)
+        except ValueError:
+            pass
+
 
 class Server(AbstractServer):
     """Standard server implementation not directly dependent on pyuv
     """
+    #: if True (default), accept exactly one connection each time the server socket becomes
+    #: readable; this avoids the accept() call which almost always fails with EAGAIN, and lets
+    #: multiple processes listening on the same address share incoming connections fairly. Set to
+    #: False in single-process servers to accept connections in batches of `accept_batch`.
+    single_accept = True
+
+    #: maximum number of connections accepted per wakeup when `single_accept` is False, so that a
+    #: flood of incoming connections cannot starve other file descriptors
+    accept_batch = 64
 
     def start(self):
-        log.debug('{0.__class__.__name__} started on {0.address}'.format(self))
-        while True:
+        log.debug('%s started on %s', self.__class__.__name__, self.address)
+        fd = self.server_sock.fileno()
+        max_accept = 1 if self.single_accept else self.accept_batch
+
+        # bind hot-loop lookups to locals
+        accept_many = self._accept_many
+        spawn = self._spawn
+        try:
+            while True:
+                trampoline(fd, READ)
+                for client_sock, addr in accept_many(max_accept):
+                    spawn(client_sock, addr)
+        except StopServe:
+            log.debug('%s stopped', self)
+            return
+
+    def _accept_many(self, max_accept):
+        """Accept pending connections until the kernel queue is drained or `max_accept` is reached
+
+        For plain green sockets this never blocks; the caller is responsible for waiting until the
+        server socket is readable again. Any other listener (e.g. an SSL socket, whose accept()
+        performs the handshake, or a stdlib socket) is accepted from exactly once through its own
+        accept(), since it has no non-blocking accept primitive.
+
+        If accepting fails (e.g. with EMFILE) after some connections have already been accepted,
+        those connections are returned and the error is left for the next call to raise.
+
+        :param int max_accept: maximum number of connections to accept
+        :return: list of (client_sock, addr) tuples, empty if there are no pending connections
+        :rtype: list[tuple[socket.socket, tuple[str, int]]]
+        """
+        server_sock = self.server_sock
+        if type(server_sock) is not socket.socket:
+            return [server_sock.accept()]
+
+        accept = server_sock._socket_accept
+        family, type_, proto = server_sock.family, server_sock.type, server_sock.proto
+        new_socket = socket.socket
+
+        batch = []
+        append = batch.append
+        for _ in range(max_accept):
+            # returns None on EWOULDBLOCK/EAGAIN
             try:
-                client_sock, addr = self.server_sock.accept()
-                self._spawn(client_sock, addr)
-            except StopServe:
-                log.debug('{0} stopped'.format(self))
-                return
+                res = accept()
+            except OSError:
+                if batch:
+                    # don't drop the connections accepted so far
+                    break
+                raise
+
+            if res is None:
+                break
+
+            fd, addr = res
+            append((new_socket(family, type_, proto, fileno=fd), addr))
+
+        return batch
 
     def stop(self):
-        log.debug('{0}: stopping'.format(self))
+        log.debug('%s: stopping', self)
@@ -696,8 +696,12 @@ def serve(server_sock, app, log_output=True):
     :param app: WSGI application callable
     """
     try:
-        host, port = server_sock.getsockname()[:2]
-        log.info('WSGI server starting up on {}:{}'.format(host, port))
+        address = server_sock.getsockname()
+        if isinstance(address, tuple):
+            host, port = address[:2]
+            log.info('WSGI server starting up on {}:{}'.format(host, port))
+        else:
+            log.info('WSGI server starting up on {}'.format(address))
 
         wsgi_server = WSGIServer(server_sock, app)
         wsgi_server.start()
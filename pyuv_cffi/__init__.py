@@ -106,6 +106,26 @@ def default_close_cb(uv_handle_t, handle):
     handle._ffi_close_cb = None
 
 
+def _wrap_handle_cb(handle, callback):
+    """Wrap a Callable(handle: Handle) for a C callback taking only the handle pointer
+    """
+
+    def cb_wrapper(uv_handle_t):
+        callback(handle)
+
+    return cb_wrapper
+
+
+def _wrap_poll_cb(handle, callback):
+    """Wrap a Callable(poll_handle: Poll, status: int, events: int) for a uv_poll_cb
+    """
+
+    def cb_wrapper(uv_poll_t, status, events):
+        callback(handle, status, events)
+
+    return cb_wrapper
+
+
 class Handle:
     def __init__(self, handle):
         """
@@ -114,9 +134,13 @@ class Handle:
         # uv_handle_t
         self.uv_handle = libuv.cast_handle(handle)
         self._ffi_cb = None
+        self._callback = None
         self._ffi_close_cb = None
         self._close_called = False
 
+        #: arbitrary user data; not used by pyuv_cffi
+        self.data = None
+
         # store a reference to `self` in the underlying `uv_handle_t.data`
         self_h = ffi.new_handle(self)
         self.uv_handle.data = self_h
@@ -160,6 +184,23 @@ class Handle:
         """
         return bool(libuv.uv_is_closing(self.uv_handle))
 
+    def _get_ffi_cb(self, callback, ctype, wrapper):
+        """Get the FFI callback calling `callback`
+
+        The FFI callback is reused if the handle is restarted with the same callback, since creating
+        one is expensive.
+
+        :param callback: Python callback
+        :param str ctype: C function pointer type of the FFI callback
+        :param wrapper: Callable(handle: Handle, callback) returning the function to wrap
+        :return: FFI callback
+        """
+        if self._ffi_cb is None or callback is not self._callback:
+            self._ffi_cb = ffi.callback(ctype, wrapper(self, callback))
+            self._callback = callback
+
+        return self._ffi_cb
+
     def close(self, callback=None):
         """Close uv handle
 
@@ -224,12 +265,8 @@ class Prepare(Handle):
         """
         :type callback: Callable(prepare_handle: Prepare)
         """
-
-        def cb_wrapper(prepare_h):
-            callback(self)
-
-        self._ffi_cb = ffi.callback('void (*)(uv_prepare_t *)', cb_wrapper)
-        libuv.uv_prepare_start(self.handle, self._ffi_cb)
+        ffi_cb = self._get_ffi_cb(callback, 'void (*)(uv_prepare_t *)', _wrap_handle_cb)
+        libuv.uv_prepare_start(self.handle, ffi_cb)
 
     def stop(self):
         libuv.uv_prepare_stop(self.handle)
@@ -292,11 +329,8 @@ class Timer(Handle):
         timeout = int(timeout * 1000)
         repeat = int(repeat * 1000)
 
-        def cb_wrapper(timer_h):
-            callback(self)
-
-        self._ffi_cb = ffi.callback('void (*)(uv_timer_t *)', cb_wrapper)
-        libuv.uv_timer_start(self.handle, self._ffi_cb, timeout, repeat)
+        ffi_cb = self._get_ffi_cb(callback, 'void (*)(uv_timer_t *)', _wrap_handle_cb)
+        libuv.uv_timer_start(self.handle, ffi_cb, timeout, repeat)
 
     def stop(self):
         libuv.uv_timer_stop(self.handle)
@@ -352,19 +386,16 @@ class Poll(Handle):
         :param events: UV_READABLE | UV_WRITEABLE
         :param callback: Callable(poll_handle: Poll, status: int, events: int)
         """
+        ffi_cb = self._get_ffi_cb(callback, 'void (*)(uv_poll_t *, int, int)', _wrap_poll_cb)
+        libuv.uv_poll_start(self.handle, events, ffi_cb)
 
-        def cb_wrapper(uv_poll_t, status, events):
-            callback(self, status, events)
-
-        self._ffi_cb = ffi.callback('void (*)(uv_poll_t *, int, int)', cb_wrapper)
-        libuv.uv_poll_start(self.handle, events, self._ffi_cb)
+        self._stop_called = False
 
     def stop(self):
         if self._stop_called:
             return
 
         err = libuv.uv_poll_stop(self.handle)
-        self._ffi_cb = None
         if err < 0:
             raise Exception('uv_poll_stop() failed: {}'.format(err))
 
@@ -28,3 +28,9 @@ def server_sock():
     sock = listen(('', 0))
     return sock
 
+
+@pytest.fixture(scope='function')
+def unix_addr(tmpdir):
+    """A file system path for a Unix domain socket
+    """
+    return str(tmpdir.join('guv.sock'))
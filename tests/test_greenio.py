@@ -6,9 +6,11 @@ import sys
 import pytest
 
 from guv import spawn
+from guv.const import READ
 from guv.event import Event
 from guv.greenio import socket as green_socket
 from guv.green import socket as socket_patched
+from guv.hubs import get_hub
 from guv.support import get_errno
 
 pyversion = sys.version_info[:2]
@@ -128,6 +130,21 @@ class TestGreenSocket:
         assert f.read() == b''
         killer.wait()
 
+    def test_close_evicts_poll_handles(self, server_sock):
+        hub = get_hub()
+        if not hasattr(hub, '_poll_cache'):
+            pytest.skip('hub does not cache poll handles')
+
+        fd = server_sock.fileno()
+        server_sock.settimeout(TIMEOUT_SMALL)
+        with pytest.raises(socket.timeout):
+            server_sock.accept()
+
+        poll_h = hub._poll_cache[READ, fd]
+        server_sock.close()
+        assert (READ, fd) not in hub._poll_cache
+        assert poll_h.closing
+
 
 class TestGreenSocketModule:
     def test_create_connection(self, pub_addr):
@@ -0,0 +1,144 @@
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+from guv import sleep, spawn
+from guv.event import Event
+from guv.hubs import get_hub
+from guv.hubs.switch import gyield
+
+RUN_CALLBACKS_ONLY_SCRIPT = textwrap.dedent("""
+    from guv.hubs import get_hub
+
+    hub = get_hub()
+    called = []
+    hub.schedule_call_now(called.append, 1)
+
+    # the run loop returns to this greenlet once nothing is left to do
+    hub.switch()
+    print(called, hub.dead, hub.prepare_h.active)
+""")
+
+
+class TestRunLoop:
+    @pytest.fixture
+    def hub(self):
+        hub = get_hub()
+        if not hasattr(hub, 'prepare_h'):
+            pytest.skip('hub does not use a prepare handle')
+        return hub
+
+    def test_exit_with_only_callbacks_pending(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, '-c', RUN_CALLBACKS_ONLY_SCRIPT],
+                                         cwd=root, stderr=subprocess.DEVNULL, timeout=10)
+        assert output.split(b'\n')[-2] == b'[1] True False'
+
+    def test_prepare_handle_stopped_when_idle(self, hub):
+        done = Event()
+        hub.schedule_call_now(done.send, 1)
+        assert hub.prepare_h.active
+        assert done.wait() == 1
+
+        # resumed by a timer, after the callbacks have run dry
+        sleep(0.01)
+        assert not hub._pending
+        assert not hub.prepare_h.active
+
+    def test_nested_callback_runs_next_iteration(self, hub):
+        """A callback scheduled by a callback runs on the next loop iteration, without waiting in a
+        blocking poll for the next I/O or timer event
+        """
+        done = Event()
+        deferred = []
+
+        def first():
+            hub.schedule_call_now(done.send, True)
+            deferred.append(hub._pending and len(hub.callbacks) == 1)
+
+        # a blocking poll would wait for this timer
+        timer = hub.schedule_call_global(1, lambda: None)
+        start = time.monotonic()
+
+        # schedule from a timer which is already due when the next iteration starts, so that the
+        # callbacks run within an iteration which was started with a blocking poll
+        hub.schedule_call_global(0.01, hub.schedule_call_now, first)
+        time.sleep(0.02)
+        assert done.wait()
+        assert time.monotonic() - start < 0.5
+        assert deferred == [True]
+        timer.cancel()
+
+    def test_timer_fires_during_gyield_storm(self, hub):
+        fired = []
+        iterations = []
+
+        def storm():
+            for i in range(100000):
+                if fired:
+                    break
+                gyield()
+            iterations.append(i)
+
+        hub.schedule_call_global(0.01, fired.append, 1)
+        gts = [spawn(storm) for _ in range(10)]
+        for gt in gts:
+            gt.wait()
+
+        assert fired == [1]
+        assert all(i < 99999 for i in iterations)
+
+
+class TestTimerPool:
+    @pytest.fixture
+    def hub(self):
+        hub = get_hub()
+        if not hasattr(hub, '_timer_pool'):
+            pytest.skip('hub does not pool timer handles')
+        return hub
+
+    def test_fired_timer_reused(self, hub):
+        done = Event()
+        timer = hub.schedule_call_global(0, done.send, 1)
+        timer_handle = timer.timer_handle
+        assert done.wait() == 1
+
+        assert timer.timer_handle is None
+        assert timer_handle.data is None
+        assert timer_handle in hub._timer_pool
+
+        pooled = hub._timer_pool[-1]
+        timer2 = hub.schedule_call_global(10, done.send, 2)
+        assert timer2.timer_handle is pooled
+        timer2.cancel()
+
+    def test_cancel(self, hub):
+        fired = []
+        timer = hub.schedule_call_global(0.01, fired.append, 1)
+        timer_handle = timer.timer_handle
+        timer.cancel()
+
+        assert not timer_handle.active
+        assert timer_handle in hub._timer_pool
+
+        sleep(0.02)
+        assert fired == []
+
+    def test_cancel_after_reuse(self, hub):
+        """Cancelling a timer must not affect a later timer reusing its handle
+        """
+        fired = []
+        timer = hub.schedule_call_global(10, fired.append, 1)
+        timer.cancel()
+
+        timer2 = hub.schedule_call_global(0.01, fired.append, 2)
+        assert timer2.timer_handle is not None
+        timer.cancel()
+
+        sleep(0.02)
+        sleep(0.01)
+        assert fired == [2]
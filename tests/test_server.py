@@ -0,0 +1,473 @@
+import errno
+import os
+import shutil
+import signal
+import socket
+import ssl
+import stat
+import subprocess
+import sys
+import textwrap
+import threading
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import pytest
+from greenlet import getcurrent, greenlet
+
+from guv import sleep, spawn, serve, listen, connect, wrap_ssl, StopServe
+from guv.event import Event
+from guv.green import ssl as green_ssl
+from guv.hubs import get_hub
+from guv.hubs.hub import _threadlocal as _hub_threadlocal
+from guv.greenio import socket as green_socket
+from guv.server import Server, _max_sock_buf
+
+
+@pytest.fixture(scope='module')
+def cert_files(tmpdir_factory):
+    """Self-signed certificate and key file paths
+    """
+    if shutil.which('openssl') is None:
+        pytest.skip('openssl not available')
+
+    tmpdir = tmpdir_factory.mktemp('cert')
+    certfile, keyfile = str(tmpdir.join('cert.pem')), str(tmpdir.join('key.pem'))
+    subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                           '-subj', '/CN=localhost', '-keyout', keyfile, '-out', certfile],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certfile, keyfile
+
+
+def start_server(server):
+    """Run `server` in a GreenThread and return the GreenThread
+    """
+    return spawn(server.start)
+
+
+def stop_server(gt):
+    gt.kill(StopServe())
+    gt.wait()
+
+
+class Handler:
+    """Client handler which closes each client and sets `done` after `expected` clients
+    """
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.clients = []
+        self.done = Event()
+
+    def __call__(self, client_sock, addr):
+        self.clients.append(client_sock)
+        client_sock.close()
+        if len(self.clients) == self.expected:
+            self.done.send()
+
+
+class TestAccept:
+    def test_accept_many_drains_pending(self, server_sock):
+        clients = [connect(server_sock.getsockname()) for _ in range(3)]
+        server = Server(server_sock, Handler(3))
+
+        batch = server._accept_many(64)
+        assert len(batch) == 3
+        assert all(type(sock) is green_socket for sock, addr in batch)
+        assert server._accept_many(64) == []
+
+        for sock in clients:
+            sock.close()
+
+    def test_accept_many_respects_limit(self, server_sock):
+        clients = [connect(server_sock.getsockname()) for _ in range(3)]
+        server = Server(server_sock, Handler(3))
+
+        assert len(server._accept_many(1)) == 1
+        assert len(server._accept_many(64)) == 2
+
+        for sock in clients:
+            sock.close()
+
+    @pytest.mark.skipif(resource is None, reason='resource module required')
+    def test_accept_many_keeps_partial_batch(self, server_sock):
+        """If accept() fails partway through a batch, the connections accepted so far are returned
+        """
+        clients = [connect(server_sock.getsockname()) for _ in range(3)]
+        server = Server(server_sock, Handler(3))
+
+        # leave exactly one free file descriptor, so that the second accept() fails with EMFILE
+        fd = os.dup(0)
+        os.close(fd)
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (fd + 1, hard))
+        try:
+            batch = server._accept_many(64)
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+        assert len(batch) == 1
+        assert len(server._accept_many(64)) == 2
+
+        for sock in clients:
+            sock.close()
+
+    @pytest.mark.parametrize('single_accept', [True, False])
+    def test_serve_clients(self, server_sock, single_accept):
+        handler = Handler(5)
+        server = Server(server_sock, handler)
+        server.single_accept = single_accept
+        gt = start_server(server)
+
+        clients = [connect(server_sock.getsockname()) for _ in range(5)]
+        handler.done.wait()
+        assert len(handler.clients) == 5
+
+        stop_server(gt)
+        for sock in clients:
+            sock.close()
+
+    def test_accept_uses_listener_accept(self, server_sock):
+        """Listeners other than plain green sockets (e.g. SSL sockets) must be accepted from through
+        their own accept()
+        """
+
+        class WrappedSocket(green_socket):
+            accepted = 0
+
+            def accept(self):
+                WrappedSocket.accepted += 1
+                return super().accept()
+
+        sock = WrappedSocket(fileno=server_sock.detach())
+        client = connect(sock.getsockname())
+        server = Server(sock, Handler(1))
+        server.single_accept = False
+
+        batch = server._accept_many(64)
+        assert len(batch) == 1
+        assert WrappedSocket.accepted == 1
+
+        client.close()
+        sock.close()
+
+    def test_serve_ssl(self, cert_files):
+        certfile, keyfile = cert_files
+        server_sock = wrap_ssl(listen(('127.0.0.1', 0)), server_side=True, certfile=certfile,
+                               keyfile=keyfile)
+        handler = Handler(1)
+        gt = start_server(Server(server_sock, handler))
+
+        client = wrap_ssl(connect(server_sock.getsockname()), cert_reqs=ssl.CERT_NONE)
+        handler.done.wait()
+        assert isinstance(handler.clients[0], green_ssl.SSLSocket)
+
+        stop_server(gt)
+        client.close()
+        server_sock.close()
+
+
+class TestListen:
+    def test_defaults(self):
+        sock = listen(('127.0.0.1', 0))
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR)
+        assert not sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            assert not sock.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT)
+        sock.close()
+
+    @pytest.mark.skipif(not hasattr(socket, 'SO_REUSEPORT'), reason='SO_REUSEPORT required')
+    def test_reuse_port(self):
+        sock = listen(('127.0.0.1', 0), reuse_port=True)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT)
+
+        # a second socket can listen on the same address
+        sock2 = listen(sock.getsockname(), reuse_port=True)
+        assert sock2.getsockname() == sock.getsockname()
+
+        sock2.close()
+        sock.close()
+
+    def test_rcvbuf_max(self):
+        rmem_max = _max_sock_buf('rmem_max')
+        if rmem_max is None:
+            pytest.skip('maximum socket buffer size not available')
+
+        sock = listen(('127.0.0.1', 0), rcvbuf='max')
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= rmem_max
+        sock.close()
+
+    def test_sndbuf(self):
+        sock = listen(('127.0.0.1', 0), sndbuf=16384)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= 16384
+        sock.close()
+
+    def test_nodelay(self):
+        sock = listen(('127.0.0.1', 0), nodelay=True)
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+
+        # inherited by accepted client sockets
+        client = connect(sock.getsockname())
+        client_sock, addr = sock.accept()
+        assert client_sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+
+        client_sock.close()
+        client.close()
+        sock.close()
+
+    @pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='Unix domain sockets required')
+    def test_nodelay_ignored_for_unix_sockets(self, unix_addr):
+        sock = listen(unix_addr, nodelay=True)
+        sock.close()
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='Unix domain sockets required')
+class TestUnixListen:
+    def test_listen(self, unix_addr):
+        sock = listen(unix_addr)
+        assert sock.family == socket.AF_UNIX
+        assert stat.S_ISSOCK(os.stat(unix_addr).st_mode)
+
+        server = Server(sock, Handler(1))
+        assert server.address == unix_addr
+
+        client = connect(unix_addr, socket.AF_UNIX)
+        client_sock, addr = sock.accept()
+        client.sendall(b'hello')
+        assert client_sock.recv(5) == b'hello'
+
+        client_sock.close()
+        client.close()
+        sock.close()
+
+    def test_remove_stale_socket(self, unix_addr):
+        stale = socket.socket(socket.AF_UNIX)
+        stale.bind(unix_addr)
+        stale.close()
+
+        sock = listen(unix_addr)
+        assert sock.getsockname() == unix_addr
+        sock.close()
+
+    def test_keep_other_files(self, unix_addr):
+        with open(unix_addr, 'w'):
+            pass
+
+        with pytest.raises(OSError):
+            listen(unix_addr)
+        assert os.path.isfile(unix_addr)
+
+    @pytest.mark.skipif(not sys.platform.startswith('linux'), reason='Linux abstract namespace')
+    def test_abstract_namespace(self):
+        addr = '\0guv-test-{}'.format(os.getpid())
+        sock = listen(addr)
+
+        server = Server(sock, Handler(1))
+        assert server.address == addr.encode()
+
+        sock.close()
+
+
+class TestWorkerGreenlets:
+    def test_worker_recycled(self, server_sock):
+        handler = Handler(3)
+        server = Server(server_sock, handler)
+        gt = start_server(server)
+
+        workers = set()
+        for _ in range(3):
+            client = connect(server_sock.getsockname())
+            sleep(0.01)
+            workers.update(server._greenlet_pool)
+            client.close()
+
+        handler.done.wait()
+        assert len(workers) == 1
+
+        stop_server(gt)
+
+    @pytest.mark.skipif(contextvars is None, reason='contextvars required')
+    def test_context_not_shared_between_clients(self, server_sock):
+        var = contextvars.ContextVar('var', default=None)
+        seen = []
+        handler = Handler(3)
+
+        def handle(client_sock, addr):
+            seen.append(var.get())
+            var.set(addr)
+            handler(client_sock, addr)
+
+        server = Server(server_sock, handle)
+        gt = start_server(server)
+
+        for _ in range(3):
+            client = connect(server_sock.getsockname())
+            sleep(0.01)
+            client.close()
+
+        handler.done.wait()
+        assert seen == [None, None, None]
+
+        stop_server(gt)
+
+    def test_stray_wakeup_discards_worker(self, server_sock):
+        """A worker woken by something other than the server must leave the pool, and the next
+        client must be served by a live greenlet
+        """
+        handler = Handler(2)
+
+        def handle(client_sock, addr):
+            get_hub().schedule_call_global(0.02, getcurrent().switch)
+            handler(client_sock, addr)
+
+        server = Server(server_sock, handle)
+        gt = start_server(server)
+
+        client = connect(server_sock.getsockname())
+        sleep(0.05)
+        assert not server._greenlet_pool
+
+        client2 = connect(server_sock.getsockname())
+        handler.done.wait()
+        assert len(handler.clients) == 2
+
+        stop_server(gt)
+        client.close()
+        client2.close()
+
+    def test_spawn_skips_dead_greenlets(self, server_sock):
+        handler = Handler(1)
+        server = Server(server_sock, handler)
+        gt = start_server(server)
+
+        dead = greenlet(lambda: None)
+        dead.switch()
+        server._greenlet_pool.append(dead)
+
+        client = connect(server_sock.getsockname())
+        handler.done.wait()
+        assert dead not in server._greenlet_pool
+
+        stop_server(gt)
+        client.close()
+
+
+SERVE_WORKERS_SCRIPT = textwrap.dedent("""
+    import os
+    import socket
+
+    import guv
+
+    def handle(client_sock, addr):
+        nodelay = client_sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        sndbuf = client_sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+        client_sock.sendall('{} {} {}'.format(os.getpid(), int(bool(nodelay)), sndbuf).encode())
+        client_sock.close()
+
+    sock = guv.listen(('127.0.0.1', 0), reuse_port=True, sndbuf=16384, nodelay=True)
+    print(sock.getsockname()[1], sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF), flush=True)
+    guv.serve(sock, handle, workers=3)
+""")
+
+
+@pytest.mark.skipif(not hasattr(socket, 'SO_REUSEPORT') or not hasattr(os, 'fork'),
+                    reason='SO_REUSEPORT and fork() required')
+class TestServeWorkers:
+    def test_requires_reuse_port(self, server_sock):
+        with pytest.raises(ValueError):
+            serve(server_sock, Handler(1), workers=2)
+
+    def test_requires_listen_socket(self, server_sock):
+        sock = green_socket(fileno=server_sock.detach())
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        with pytest.raises(ValueError):
+            serve(sock, Handler(1), workers=2)
+        sock.close()
+
+    def test_requires_main_thread(self):
+        sock = listen(('127.0.0.1', 0), reuse_port=True)
+        errors = []
+
+        def run():
+            try:
+                serve(sock, Handler(1), workers=2)
+            except RuntimeError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        assert len(errors) == 1
+        sock.close()
+
+    def test_requires_unused_hub(self):
+        get_hub()
+        sock = listen(('127.0.0.1', 0), reuse_port=True)
+        with pytest.raises(RuntimeError):
+            serve(sock, Handler(1), workers=2)
+        sock.close()
+
+    def test_fork_failure_stops_started_workers(self, monkeypatch):
+        # pretend that the hub has not been used yet in this process
+        monkeypatch.delattr(_hub_threadlocal, 'hub', raising=False)
+
+        sock = listen(('127.0.0.1', 0), reuse_port=True)
+        pids = [1001, 1002]
+        killed, reaped = [], []
+
+        def fork():
+            if not pids:
+                raise OSError(errno.EAGAIN, 'Resource temporarily unavailable')
+            return pids.pop(0)
+
+        monkeypatch.setattr(os, 'fork', fork)
+        monkeypatch.setattr(os, 'kill', lambda pid, signo: killed.append(pid))
+        monkeypatch.setattr(os, 'waitpid', lambda pid, options: reaped.append(pid) or (pid, 0))
+
+        with pytest.raises(OSError):
+            serve(sock, Handler(1), workers=4)
+
+        assert sorted(killed) == sorted(reaped) == [1001, 1002]
+        sock.close()
+
+    def test_workers(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        proc = subprocess.Popen([sys.executable, '-c', SERVE_WORKERS_SCRIPT], cwd=root,
+                                stdout=subprocess.PIPE)
+        pids = set()
+        try:
+            port, sndbuf = proc.stdout.readline().split()
+            port = int(port)
+
+            # connections only spread across processes once the children are listening
+            responses = set()
+            for _ in range(500):
+                with socket.create_connection(('127.0.0.1', port), timeout=5) as client:
+                    responses.add(client.recv(64).decode())
+
+                if len({r.split()[0] for r in responses}) == 3:
+                    break
+
+            pids = {int(r.split()[0]) for r in responses}
+            assert len(pids) == 3
+            assert proc.pid in pids
+            # workers' sockets are created with the same options as the parent's
+            assert all(r.split()[1:] == ['1', sndbuf.decode()] for r in responses)
+        finally:
+            proc.send_signal(signal.SIGINT)
+            proc.wait(5)
+            proc.stdout.close()
+
+        # the parent terminates and reaps its children before exiting
+        for pid in pids - {proc.pid}:
+            with pytest.raises(ProcessLookupError):
+                os.kill(pid, 0)
+